@@ -1,14 +1,38 @@
 # This file will contain video editing functions. 
 
 import os
+import sys
+import signal
 import subprocess
 import shutil # To check for ffmpeg
+import threading
+import functools
+import collections
 
 EDITED_VIDEOS_DIR = "edited_videos"
 
 # Ensure output directory exists
 os.makedirs(EDITED_VIDEOS_DIR, exist_ok=True)
 
+# libx264 settings; overridable per run through the edits dict ("preset", "crf", "tune")
+DEFAULT_PRESET = os.environ.get("TTVM_PRESET", "veryfast")
+DEFAULT_CRF = 23
+DEFAULT_TUNE = os.environ.get("TTVM_TUNE", "") # Off by default; e.g. TTVM_TUNE=fastdecode trades quality for decode speed
+
+DEFAULT_EDITS = {
+    "mirror": True,
+    "crop_percent": 2, # Crop 2% from each side
+}
+
+# Extra Popen options for every FFmpeg process. On Windows, CREATE_NO_WINDOW stops a console window
+# flashing up per call. On POSIX, FFmpeg gets its own session so a timed-out run can be killed as a
+# whole process group; setsid does not stop CPython from using its vfork fast path.
+# Never add preexec_fn here: it forces a full fork() of the GUI process.
+if sys.platform == "win32":
+    _POPEN_KW = {"creationflags": 0x08000000} # subprocess.CREATE_NO_WINDOW
+else:
+    _POPEN_KW = {"start_new_session": True}
+
 def _log(message, level="INFO", log_queue=None):
     """Helper function to log to queue or print."""
     if log_queue:
@@ -16,9 +40,357 @@ def _log(message, level="INFO", log_queue=None):
     else:
         print(f"[{level}] {message}")
 
+@functools.lru_cache(maxsize=1)
+def _ffmpeg_bin():
+    """Resolves the absolute path of ffmpeg once per process, or None if it is not in PATH."""
+    return shutil.which("ffmpeg")
+
 def check_ffmpeg():
     """Checks if ffmpeg is accessible in the system PATH."""
-    return shutil.which("ffmpeg") is not None
+    return _ffmpeg_bin() is not None
+
+# Hardware H.264 encoders in order of preference, keyed by the name used internally.
+HW_ENCODERS = (
+    ("nvenc", "h264_nvenc"),
+    ("vaapi", "h264_vaapi"),
+    ("qsv", "h264_qsv"),
+    ("videotoolbox", "h264_videotoolbox"),
+)
+VAAPI_DEVICE = "/dev/dri/renderD128"
+PIXEL_FORMAT_FILTER = "format=yuv420p"
+
+STDERR_TAIL_CHUNKS = 64 # 64KB reads kept from FFmpeg's stderr
+STDERR_TAIL_CHARS = 8192 # Characters of stderr reported when FFmpeg fails
+
+# Cached result of the FFmpeg capability probe (None until first detection)
+_hw_capabilities = None
+_hw_lock = threading.Lock()
+
+def _probe_ffmpeg_list(list_flag):
+    """Returns the output of `ffmpeg -hide_banner <list_flag>` (e.g. -encoders), or "" on failure."""
+    try:
+        if not check_ffmpeg():
+            return ""
+        result = subprocess.run([_ffmpeg_bin(), "-hide_banner", list_flag], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, timeout=10, **_POPEN_KW)
+        return result.stdout if result.returncode == 0 else ""
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+def _encoder_works(hw, encoder):
+    """
+    Encodes one synthetic frame with the given hardware encoder. Static FFmpeg builds list
+    h264_nvenc/h264_qsv even on machines without that hardware, so being listed is not enough.
+    """
+    if hw == "vaapi" and not os.path.exists(VAAPI_DEVICE):
+        return False
+    cmd = [_ffmpeg_bin(), "-hide_banner", "-loglevel", "error"] + _hw_global_args(hw)
+    cmd.extend(["-f", "lavfi", "-i", "color=s=256x256", "-frames:v", "1"])
+    if hw == "vaapi":
+        cmd.extend(["-vf", "format=nv12,hwupload"])
+    cmd.extend(["-c:v", encoder, "-f", "null", "-"])
+    try:
+        result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=15, **_POPEN_KW)
+        return result.returncode == 0
+    except (OSError, subprocess.SubprocessError):
+        return False
+
+def _get_hw_capabilities():
+    """Probes FFmpeg once for a working hardware encoder and CUDA filters. Result is cached."""
+    global _hw_capabilities
+    with _hw_lock:
+        if _hw_capabilities is None:
+            encoders_output = _probe_ffmpeg_list("-encoders")
+            encoder_names = {line.split()[1] for line in encoders_output.splitlines() if len(line.split()) > 1}
+            hw = next((name for name, encoder in HW_ENCODERS if encoder in encoder_names and _encoder_works(name, encoder)), None)
+            cuda_filters = False
+            if hw == "nvenc":
+                filters_output = _probe_ffmpeg_list("-filters")
+                cuda_filters = "hflip_cuda" in filters_output and "crop_cuda" in filters_output
+            _hw_capabilities = {"encoder": hw, "cuda_filters": cuda_filters}
+        return _hw_capabilities
+
+def _disable_hw_encoder():
+    """Switches the rest of the session to libx264 after the hardware encoder failed on a real video."""
+    with _hw_lock:
+        if _hw_capabilities is not None:
+            _hw_capabilities["encoder"] = None
+            _hw_capabilities["cuda_filters"] = False
+    _command_template.cache_clear() # Cached x264 thread counts depend on the encoder
+
+def _detect_hw_encoder():
+    """Returns one of "nvenc", "vaapi", "qsv", "videotoolbox", or None if only software encoding is available."""
+    return _get_hw_capabilities()["encoder"]
+
+def _hw_global_args(hw):
+    """Returns the global FFmpeg arguments (given once per command) for the given encoder backend."""
+    if hw == "vaapi":
+        return ["-vaapi_device", VAAPI_DEVICE]
+    return []
+
+def _hw_input_args(hw):
+    """Returns the FFmpeg arguments that must precede each input's -i for the given encoder backend."""
+    if hw == "nvenc":
+        # Decode on the GPU and keep frames in VRAM where possible
+        return ["-hwaccel", "cuda", "-hwaccel_output_format", "cuda"]
+    return []
+
+def _trim_input_args(edits=None):
+    """
+    Returns input-side -ss/-to for edits["trim_start"] / edits["trim_end"] (seconds).
+    Placed before -i, the demuxer seeks via the index and only the kept range is decoded.
+    When re-encoding, FFmpeg's accurate_seek (on by default) still makes the cut frame-accurate;
+    a stream-copy remux can only cut on keyframes.
+    """
+    args = []
+    if edits:
+        if edits.get("trim_start"):
+            args.extend(["-ss", str(edits["trim_start"])])
+        if edits.get("trim_end"):
+            args.extend(["-to", str(edits["trim_end"])])
+    return args
+
+def _hw_filters(hw, filters):
+    """Adapts a list of software filter expressions to the given encoder backend."""
+    video_filters = list(filters)
+    if hw == "nvenc":
+        if video_filters:
+            # Frames are already NV12 on this path, so the software pixel-format pin is dropped
+            video_filters = [f for f in video_filters if f != PIXEL_FORMAT_FILTER]
+            if _get_hw_capabilities()["cuda_filters"]:
+                # crop_cuda then hflip_cuda keeps the whole pass in VRAM
+                video_filters = [f.replace("hflip", "hflip_cuda", 1).replace("crop=", "crop_cuda=", 1) for f in video_filters]
+            else:
+                # Filters not built for CUDA: round-trip through system memory for the filter chain only
+                video_filters = ["hwdownload", "format=nv12"] + video_filters + ["hwupload_cuda"]
+    elif hw == "vaapi":
+        # Filters run in software, then frames are uploaded to the VAAPI surface for encoding
+        video_filters = video_filters + ["format=nv12|vaapi", "hwupload"]
+    return video_filters
+
+def _video_codec_args(hw, edits=None):
+    """Returns the video encoder arguments for the given encoder backend."""
+    edits = edits or {}
+    if hw == "nvenc":
+        return ["-c:v", "h264_nvenc", "-preset", "p4", "-rc", "vbr", "-cq", "23", "-b:v", "0"]
+    if hw == "vaapi":
+        return ["-c:v", "h264_vaapi", "-qp", "23"]
+    if hw == "qsv":
+        return ["-c:v", "h264_qsv", "-global_quality", "23"]
+    if hw == "videotoolbox":
+        return ["-c:v", "h264_videotoolbox", "-b:v", "6M"]
+    args = [
+        "-c:v", "libx264",         # Video codec
+        "-preset", str(edits.get("preset", DEFAULT_PRESET)), # Encoding speed/quality trade-off
+        "-crf", str(edits.get("crf", DEFAULT_CRF)), # Constant Rate Factor (quality, lower is better, 18-28 is typical)
+    ]
+    tune = edits.get("tune", DEFAULT_TUNE)
+    if tune:
+        args.extend(["-tune", tune])
+    x264_params = edits.get("x264_params", _default_x264_params(edits.get("preset", DEFAULT_PRESET)))
+    if x264_params:
+        args.extend(["-threads", "0", "-x264-params", x264_params])
+    return args
+
+def _default_x264_params(preset):
+    """
+    Returns the default -x264-params: sliced threads fill every core on short clips where frame
+    threading cannot, with a capped lookahead. Threads are shared between the parallel edits.
+    """
+    if preset == "ultrafast":
+        return "" # ultrafast already turns off CABAC and lookahead; leave it alone
+    threads = max(1, (os.cpu_count() or 4) // max_parallel_edits())
+    return f"sliced-threads=1:threads={threads}:rc-lookahead=20:keyint=60:min-keyint=30"
+
+# Containers whose audio (AAC for TikTok downloads) can be copied into the MP4 output unchanged
+AUDIO_COPY_EXTENSIONS = (".mp4", ".m4a", ".m4v", ".mov")
+
+def _pick_audio_args(input_video_path):
+    """
+    Returns the audio arguments for an input. The edits only touch video, so audio from an
+    MP4-family source is stream-copied; anything else is re-encoded to AAC.
+    """
+    if os.path.splitext(input_video_path)[1].lower() in AUDIO_COPY_EXTENSIONS:
+        return ["-c:a", "copy"]
+    return [
+        "-c:a", "aac",             # Audio codec
+        "-b:a", "128k",            # Audio bitrate
+    ]
+
+def _container_args(edits=None):
+    """Returns the MP4 muxer arguments."""
+    if edits and edits.get("fragmented", False):
+        # Fragmented MP4 is written in a single sequential pass (no moov relocation afterwards)
+        return ["-movflags", "+frag_keyframe+empty_moov+default_base_moof"]
+    return ["-movflags", "+faststart"] # Put the moov atom up front so playback can start before the download completes
+
+def _build_cmd(hw, filters, input_video_path, output_video_path, edits=None):
+    """
+    Builds the FFmpeg command for the given encoder backend.
+    Args:
+        hw (str or None): Hardware encoder from _detect_hw_encoder(), None for libx264.
+        filters (list): Software filter expressions, e.g. ["hflip", "crop=w:h:x:y"].
+        input_video_path (str): Source video.
+        output_video_path (str): Destination video.
+        edits (dict, optional): Encoder overrides such as "preset" and "crf".
+    Returns:
+        list: The FFmpeg argument list.
+    """
+    cmd = [_ffmpeg_bin(), "-y"] + _hw_global_args(hw) + _hw_input_args(hw) + _trim_input_args(edits) + ["-i", input_video_path]
+    video_filters = _hw_filters(hw, filters)
+    if video_filters:
+        cmd.extend(["-vf", ",".join(video_filters)])
+    cmd.extend(_video_codec_args(hw, edits))
+    cmd.extend(_pick_audio_args(input_video_path))
+    cmd.extend(_container_args(edits))
+    cmd.append(output_video_path)
+    return cmd
+
+def _build_remux_cmd(input_video_path, output_video_path, edits=None):
+    """Builds an FFmpeg command that copies all streams into a new MP4 without re-encoding."""
+    return [_ffmpeg_bin(), "-y"] + _trim_input_args(edits) + ["-i", input_video_path, "-c", "copy"] + _container_args(edits) + [output_video_path]
+
+def _build_filters(edits):
+    """
+    Translates an edits dict into a list of software FFmpeg filter expressions.
+    Crop runs first so the flip only touches the pixels that are kept.
+    """
+    video_filters = []
+
+    # 1. Cropping (as a percentage from borders)
+    crop_percent = edits.get("crop_percent", 0)
+    if crop_percent > 0 and crop_percent < 50:
+        # Crop is expressed against the decoded stream's iw/ih, so no ffprobe pass is needed.
+        # trunc(x/2)*2 keeps the output dimensions even, as some codecs prefer it.
+        fraction = crop_percent / 100.0
+        keep = 1 - 2 * fraction
+        crop_filter = f"crop=trunc(iw*{keep:g}/2)*2:trunc(ih*{keep:g}/2)*2:trunc(iw*{fraction:g}):trunc(ih*{fraction:g})"
+        video_filters.append(crop_filter)
+
+    # 2. Mirroring (Horizontal Flip)
+    if edits.get("mirror"):
+        if video_filters:
+            # Pin the pixel format between crop and flip so negotiation doesn't insert a scaler
+            video_filters.append(PIXEL_FORMAT_FILTER)
+        video_filters.append("hflip")
+
+    return video_filters
+
+def _log_filters(video_filters, log_queue=None):
+    """Logs the filter chain about to be applied."""
+    if video_filters:
+        _log(f"Applying FFmpeg filters: {','.join(video_filters)}", "DEBUG", log_queue)
+
+# Placeholder tokens substituted into cached command templates
+_IN_TOKEN = "{IN}"
+_OUT_TOKEN = "{OUT}"
+
+@functools.lru_cache(maxsize=32)
+def _command_template(hw, edit_items, input_ext):
+    """
+    Builds the edit_video command once per (encoder, edits, input extension) combination.
+    Args:
+        hw (str or None): Hardware encoder from _detect_hw_encoder(), None for libx264.
+        edit_items (tuple): Sorted items of the edits dict (values must be hashable).
+        input_ext (str): Lower-cased input file extension, which decides the audio arguments.
+    Returns:
+        tuple: (argv template with _IN_TOKEN/_OUT_TOKEN placeholders, tuple of software filters)
+    """
+    edits = dict(edit_items)
+    video_filters = _build_filters(edits)
+    # The input placeholder carries the real extension so _pick_audio_args sees the same suffix
+    input_token = _IN_TOKEN + input_ext
+    if video_filters:
+        cmd = _build_cmd(hw, video_filters, input_token, _OUT_TOKEN, edits)
+    else:
+        cmd = _build_remux_cmd(input_token, _OUT_TOKEN, edits)
+    return tuple(cmd), tuple(video_filters)
+
+def _command_for(hw, edits, input_video_path, output_video_path):
+    """
+    Returns the edit_video argv for one video from the cached template.
+    Returns:
+        tuple: (argv list, tuple of software filters; empty when the command is a stream-copy remux)
+    """
+    input_ext = os.path.splitext(input_video_path)[1].lower()
+    template, video_filters = _command_template(hw, tuple(sorted(edits.items())), input_ext)
+    input_token = _IN_TOKEN + input_ext
+    argv = [input_video_path if arg == input_token else output_video_path if arg == _OUT_TOKEN else arg for arg in template]
+    return argv, video_filters
+
+def max_parallel_edits():
+    """Returns how many edit_video calls may run at once without oversubscribing the encoder."""
+    if _detect_hw_encoder() == "nvenc":
+        return 2 # Consumer NVIDIA cards limit the number of concurrent NVENC sessions
+    return max(1, min((os.cpu_count() or 2) // 2, 4))
+
+def _log_container_choice(edits, log_queue=None):
+    """Explains the MP4 layout trade-off when fragmented output is requested."""
+    if edits.get("fragmented", False):
+        _log("Writing fragmented MP4 (single pass, no faststart rewrite). Some legacy players may not be able to seek in it.", "DEBUG", log_queue)
+
+def _safe_unlink(path, log_queue=None):
+    """Removes a file if it exists, without a separate existence check."""
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        _log(f"Error removing file {path}: {e}", "WARNING", log_queue)
+
+def _output_path_for(video_id):
+    """Returns the path the edited version of a video is written to."""
+    return os.path.join(EDITED_VIDEOS_DIR, f"{video_id}_edited_ffmpeg.mp4")
+
+def _kill_process(process):
+    """Kills an FFmpeg process started with _POPEN_KW, including its process group on POSIX."""
+    if sys.platform == "win32":
+        process.kill()
+        return
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass # Already exited
+
+def _run_ffmpeg(cmd, timeout):
+    """
+    Runs an FFmpeg command, keeping only the tail of its stderr.
+    stdout is discarded and stderr is read as raw bytes into a bounded buffer, so long encodes
+    neither decode nor accumulate megabytes of progress output.
+    Args:
+        cmd (list): The FFmpeg argument list.
+        timeout (float): Seconds to wait before the process is killed.
+    Returns:
+        tuple: (return code, decoded tail of stderr)
+    Raises:
+        subprocess.TimeoutExpired: If the process ran too long; it has been killed and
+            the exception's stderr attribute holds the decoded tail.
+    """
+    chunks = collections.deque(maxlen=STDERR_TAIL_CHUNKS)
+    # The with block closes the stderr pipe on every path
+    with subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, bufsize=1 << 20, **_POPEN_KW) as process:
+
+        def drain():
+            for chunk in iter(lambda: process.stderr.read1(64 * 1024), b""):
+                chunks.append(chunk)
+
+        reader = threading.Thread(target=drain, daemon=True)
+        reader.start()
+        try:
+            returncode = process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            _kill_process(process)
+            process.wait()
+            reader.join()
+            raise subprocess.TimeoutExpired(cmd, timeout, stderr=_decode_tail(chunks))
+        except BaseException:
+            if process.poll() is None: _kill_process(process) # Ensure process is killed if running
+            raise
+        reader.join()
+    return returncode, _decode_tail(chunks)
+
+def _decode_tail(chunks):
+    """Decodes the last few KB of buffered stderr chunks."""
+    return b"".join(chunks).decode("utf-8", "replace")[-STDERR_TAIL_CHARS:]
 
 def edit_video(input_video_path, video_id, edits=None, log_queue=None):
     """
@@ -26,7 +398,10 @@ def edit_video(input_video_path, video_id, edits=None, log_queue=None):
     Args:
         input_video_path (str): Path to the original video file.
         video_id (str): The ID of the video, used for naming the output file.
-        edits (dict, optional): Dict specifying edits. e.g., {"mirror": True, "crop_percent": 5}
+        edits (dict, optional): Dict specifying edits. e.g., {"mirror": True, "crop_percent": 5}.
+            libx264 encoding can be tuned with "preset", "crf", "tune" and "x264_params".
+            "fragmented": True writes a fragmented MP4 in one pass instead of using +faststart.
+            "trim_start"/"trim_end" (seconds) keep only that range of the source.
         log_queue (queue.Queue, optional): Queue for sending log messages to GUI.
     Returns:
         str: Path to the edited video, or None if an error occurred.
@@ -40,117 +415,68 @@ def edit_video(input_video_path, video_id, edits=None, log_queue=None):
         _log(f"Input video not found at {input_video_path}", "ERROR", log_queue)
         return None
 
-    output_filename = f"{video_id}_edited_ffmpeg.mp4"
-    output_video_path = os.path.join(EDITED_VIDEOS_DIR, output_filename)
+    output_video_path = _output_path_for(video_id)
 
     if edits is None:
-        edits = {
-            "mirror": True,
-            "crop_percent": 2, # Crop 2% from each side
-        }
+        edits = DEFAULT_EDITS
 
     try:
         _log(f"Starting FFmpeg editing for: {input_video_path}", "INFO", log_queue)
         if log_queue: log_queue.put(("STATUS_UPDATE", f"Editing video {video_id} with FFmpeg..."))
 
-        # Get video dimensions for cropping calculation
-        ffprobe_cmd = [
-            "ffprobe", "-v", "error", "-select_streams", "v:0",
-            "-show_entries", "stream=width,height", "-of", "csv=s=x:p=0",
-            input_video_path
-        ]
-        
-        process_probe = subprocess.Popen(ffprobe_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        stdout_probe, stderr_probe = process_probe.communicate(timeout=10)
-
-        if process_probe.returncode != 0:
-            _log(f"ffprobe failed to get video dimensions for {video_id}. Error: {stderr_probe}", "ERROR", log_queue)
-            return None
-        
-        try:
-            original_width, original_height = map(int, stdout_probe.strip().split('x'))
-            _log(f"Original dimensions for {video_id}: {original_width}x{original_height}", "DEBUG", log_queue)
-        except ValueError as e:
-            _log(f"Could not parse dimensions from ffprobe output '{stdout_probe.strip()}': {e}", "ERROR", log_queue)
-            return None
+        hw_encoder = _detect_hw_encoder()
+        ffmpeg_cmd, video_filters = _command_for(hw_encoder, edits, input_video_path, output_video_path)
+        _log_filters(video_filters, log_queue)
+        _log_container_choice(edits, log_queue)
 
-        video_filters = []
-
-        # 1. Mirroring (Horizontal Flip)
-        if edits.get("mirror"):
-            _log("Applying horizontal flip (mirroring) with FFmpeg...", "DEBUG", log_queue)
-            video_filters.append("hflip")
-
-        # 2. Cropping (as a percentage from borders)
-        crop_percent = edits.get("crop_percent", 0)
-        if crop_percent > 0 and crop_percent < 50:
-            # Calculate crop dimensions
-            crop_w_each_side = int(original_width * (crop_percent / 100.0))
-            crop_h_each_side = int(original_height * (crop_percent / 100.0))
-            
-            out_w = original_width - (2 * crop_w_each_side)
-            out_h = original_height - (2 * crop_h_each_side)
-            offset_x = crop_w_each_side
-            offset_y = crop_h_each_side
-            
-            # Ensure dimensions are even, as some codecs prefer it
-            out_w = out_w if out_w % 2 == 0 else out_w -1
-            out_h = out_h if out_h % 2 == 0 else out_h -1
-            if out_w <=0 or out_h <=0:
-                _log(f"Crop dimensions result in invalid output size for {video_id}. Skipping crop.", "WARNING", log_queue)
-            else:
-                crop_filter = f"crop={out_w}:{out_h}:{offset_x}:{offset_y}"
-                _log(f"Applying crop with FFmpeg: {crop_filter}", "DEBUG", log_queue)
-                video_filters.append(crop_filter)
-
-        ffmpeg_cmd = ["ffmpeg", "-y", "-i", input_video_path]
-        if video_filters:
-            ffmpeg_cmd.extend(["-vf", ",".join(video_filters)])
-        
-        # Add common output options for reasonable quality and compatibility
-        ffmpeg_cmd.extend([
-            "-c:v", "libx264",         # Video codec
-            "-preset", "medium",        # Encoding speed/quality trade-off
-            "-crf", "23",               # Constant Rate Factor (quality, lower is better, 18-28 is typical)
-            "-c:a", "aac",             # Audio codec
-            "-b:a", "128k",            # Audio bitrate
-            output_video_path
-        ])
+        if not video_filters:
+            # Identity edit: re-encoding would only lose quality, so the streams are copied as they are
+            _log("No filters; performing stream-copy remux", "DEBUG", log_queue)
+            hw_encoder = None
 
         _log(f"Executing FFmpeg command: {' '.join(ffmpeg_cmd)}", "DEBUG", log_queue)
         if log_queue: log_queue.put(("STATUS_UPDATE", f"Applying FFmpeg edits for {video_id}..."))
 
-        process = subprocess.Popen(ffmpeg_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        stdout, stderr = process.communicate(timeout=120) # 2-minute timeout for encoding
+        returncode, stderr = _run_ffmpeg(ffmpeg_cmd, timeout=120) # 2-minute timeout for encoding
+
+        if returncode != 0 and hw_encoder:
+            # The encoder can be compiled in without a usable device behind it; retry in software
+            _log(f"Hardware encoding ({hw_encoder}) failed for {video_id}. Falling back to libx264.", "WARNING", log_queue)
+            _log(f"FFmpeg stderr: {stderr}", "DEBUG", log_queue)
+            ffmpeg_cmd, _ = _command_for(None, edits, input_video_path, output_video_path)
+            _log(f"Executing FFmpeg command: {' '.join(ffmpeg_cmd)}", "DEBUG", log_queue)
+            returncode, stderr = _run_ffmpeg(ffmpeg_cmd, timeout=120)
+            if returncode == 0:
+                # The same input encoded fine in software, so the hardware encoder is at fault, not the file
+                _log(f"libx264 succeeded where {hw_encoder} failed. Using libx264 for the rest of the session.", "WARNING", log_queue)
+                _disable_hw_encoder()
 
-        if process.returncode == 0 and os.path.exists(output_video_path) and os.path.getsize(output_video_path) > 0:
+        if returncode == 0 and _is_valid_output(output_video_path):
             _log(f"FFmpeg edited video saved successfully: {output_video_path}", "SUCCESS", log_queue)
             return output_video_path
         else:
-            _log(f"FFmpeg editing failed for {video_id}. Return code: {process.returncode}", "ERROR", log_queue)
-            _log(f"FFmpeg stdout: {stdout}", "DEBUG", log_queue)
+            _log(f"FFmpeg editing failed for {video_id}. Return code: {returncode}", "ERROR", log_queue)
             _log(f"FFmpeg stderr: {stderr}", "ERROR", log_queue)
-            if os.path.exists(output_video_path): # Clean up failed output
-                try: os.remove(output_video_path)
-                except OSError as e_rem: _log(f"Error removing failed FFmpeg output {output_video_path}: {e_rem}","WARNING", log_queue)
+            _safe_unlink(output_video_path, log_queue) # Clean up failed output
             return None
 
-    except subprocess.TimeoutExpired:
+    except subprocess.TimeoutExpired as e_timeout:
         _log(f"FFmpeg command timed out for video {video_id}.", "ERROR", log_queue)
-        if process: process.kill()
-        stdout, stderr = process.communicate()
-        _log(f"FFmpeg stdout (timeout): {stdout}", "DEBUG", log_queue)
-        _log(f"FFmpeg stderr (timeout): {stderr}", "ERROR", log_queue)
-        if os.path.exists(output_video_path): os.remove(output_video_path)
+        _log(f"FFmpeg stderr (timeout): {e_timeout.stderr}", "ERROR", log_queue)
+        _safe_unlink(output_video_path, log_queue)
         return None
     except Exception as e:
         _log(f"Unexpected error during FFmpeg video editing for {input_video_path}: {e}", "ERROR", log_queue)
-        if 'process' in locals() and process and process.poll() is None: process.kill() # Ensure process is killed if running
-        if os.path.exists(output_video_path): 
-            try: os.remove(output_video_path)
-            except OSError as e_rem_ex: _log(f"Error removing file {output_video_path} on exception: {e_rem_ex}","WARNING", log_queue)
+        _safe_unlink(output_video_path, log_queue)
         return None
 
+def _is_valid_output(path):
+    """Checks that FFmpeg produced a non-empty output file."""
+    try:
+        return os.path.getsize(path) > 0
+    except OSError:
+        return False
+
 if __name__ == '__main__':
     # This test block will now rely on FFmpeg being in the PATH.
     _log("Video Editor Test Script (using FFmpeg directly)", "INFO")
@@ -3,6 +3,7 @@ import tkinter as tk
 from tkinter import messagebox
 import threading
 import queue
+import concurrent.futures
 import time # For demo purposes or small delays
 import traceback # <--- Added this import
 import os # For checking paths
@@ -12,6 +13,44 @@ import scraper
 import editor
 import utils
 
+LOG_MAX_LINES = 2000 # Older log lines are dropped from the textbox beyond this
+
+# Text colour per log level; levels not listed use the default colour
+LOG_TAG_COLORS = (("error", "red"), ("critical", "red"), ("warning", "orange"), ("success", "green"))
+LOG_LEVEL_TAGS = {level.upper(): f"log_{level}" for level, _ in LOG_TAG_COLORS}
+
+class GuiQueue(queue.Queue):
+    """
+    Queue for worker-to-GUI messages that wakes the Tk main loop when something is put.
+    Only one <<LogQueued>> event is outstanding at a time; the GUI re-arms it when it drains the queue.
+    STATUS_UPDATE and PROGRESS_UPDATE only matter for their latest value, so they are not queued:
+    they overwrite the `status` / `progress` slots (a single attribute store, atomic under the GIL).
+    """
+    def __init__(self, widget):
+        super().__init__()
+        self._widget = widget
+        self._signal_pending = threading.Event()
+        self.status = None
+        self.progress = None
+
+    def put(self, item, block=True, timeout=None):
+        if item[0] == "STATUS_UPDATE":
+            self.status = item[1]
+        elif item[0] == "PROGRESS_UPDATE":
+            self.progress = item[1] # value between 0 and 1
+        else:
+            super().put(item, block, timeout)
+        if not self._signal_pending.is_set():
+            self._signal_pending.set()
+            try:
+                self._widget.event_generate("<<LogQueued>>", when="tail")
+            except (tk.TclError, RuntimeError):
+                pass # Window already destroyed; the message is simply dropped with it
+
+    def clear_signal(self):
+        """Called by the GUI before draining, so later puts signal again."""
+        self._signal_pending.clear()
+
 class App(ctk.CTk):
     def __init__(self):
         super().__init__()
@@ -52,6 +91,17 @@ class App(ctk.CTk):
         self.num_videos_entry.pack(side="left")
         self.num_videos_entry.insert(0, "3")
 
+        # Encoder preset (libx264): faster presets trade a little bitrate for much quicker encodes
+        self.preset_frame = ctk.CTkFrame(self.controls_frame, fg_color="transparent")
+        self.preset_frame.pack(pady=5, fill="x", padx=20)
+
+        self.preset_label = ctk.CTkLabel(self.preset_frame, text="Encoder preset:")
+        self.preset_label.pack(side="left", padx=(0,10))
+
+        self.preset_combobox = ctk.CTkComboBox(self.preset_frame, values=["ultrafast", "superfast", "veryfast", "faster", "fast", "medium", "slow"], width=140, state="readonly")
+        self.preset_combobox.pack(side="left")
+        self.preset_combobox.set(editor.DEFAULT_PRESET)
+
         # Start Button
         self.start_button = ctk.CTkButton(self.controls_frame, text="Start Scraping & Editing", command=self.start_scraping_thread)
         self.start_button.pack(pady=10, padx=20, fill="x")
@@ -63,6 +113,10 @@ class App(ctk.CTk):
         # --- Log Area ---
         self.log_textbox = ctk.CTkTextbox(self, state="disabled", wrap="word", height=300)
         self.log_textbox.grid(row=1, column=0, padx=20, pady=(0,10), sticky="nsew")
+        # Log level colours are configured once here rather than on every insert
+        for level, color in LOG_TAG_COLORS:
+            self.log_textbox.tag_config(f"log_{level}", foreground=color)
+        self._log_line_count = 0 # Lines currently in the textbox, tracked to avoid querying the widget
 
         # --- Status Label (Bottom) ---
         self.status_bar_frame = ctk.CTkFrame(self, height=30)
@@ -71,50 +125,66 @@ class App(ctk.CTk):
         self.status_label.pack(side="left", padx=10)
 
         # Queue for thread communication
-        self.log_queue = queue.Queue()
-        self.after(100, self.process_log_queue) # Periodically check the queue
+        self.log_queue = GuiQueue(self)
+        self._status_shown = None # Last status/progress slot values applied to the widgets
+        self._progress_shown = None
+        self.bind("<<LogQueued>>", lambda event: self.process_log_queue())
+        self.after(1000, self._poll_log_queue) # Safety net in case a wake-up event is lost
 
         self.is_scraping = False
         self.stop_event = threading.Event()
 
-    def log_message(self, message, level="INFO"):
-        """Adds a message to the log textbox."""
+    def _format_log_line(self, message, level="INFO"):
+        """Returns the (text, tag) pair used to display a log message."""
         timestamp = utils.get_timestamp()
-        formatted_message = f"[{timestamp} - {level}] {message}\n"
-        
+        return f"[{timestamp} - {level}] {message}\n", LOG_LEVEL_TAGS.get(level, "")
+
+    def _append_log_lines(self, lines):
+        """Inserts a batch of (text, tag) pairs into the log textbox in a single widget update."""
+        if not lines:
+            return
+        # Join consecutive lines that share a tag so each run is a single insert, keeping the original order
+        runs = []
+        for text, tag in lines:
+            if runs and runs[-1][1] == tag:
+                runs[-1][0].append(text)
+            else:
+                runs.append(([text], tag))
+
         self.log_textbox.configure(state="normal")
-        if level == "ERROR" or level == "CRITICAL":
-            self.log_textbox.insert("end", formatted_message, f"log_{level.lower()}")
-            self.log_textbox.tag_config(f"log_{level.lower()}", foreground="red")
-        elif level == "WARNING":
-            self.log_textbox.insert("end", formatted_message, f"log_{level.lower()}")
-            self.log_textbox.tag_config(f"log_{level.lower()}", foreground="orange")
-        elif level == "SUCCESS":
-            self.log_textbox.insert("end", formatted_message, f"log_{level.lower()}")
-            self.log_textbox.tag_config(f"log_{level.lower()}", foreground="green")
-        else:
-            self.log_textbox.insert("end", formatted_message)
+        for texts, tag in runs:
+            text = "".join(texts)
+            self.log_textbox.insert("end", text, tag)
+            self._log_line_count += text.count("\n")
+        if self._log_line_count > LOG_MAX_LINES:
+            # Drop the oldest lines so the Tk text widget never grows without bound
+            excess = self._log_line_count - LOG_MAX_LINES
+            self.log_textbox.delete("1.0", f"{excess + 1}.0")
+            self._log_line_count = LOG_MAX_LINES
         self.log_textbox.configure(state="disabled")
         self.log_textbox.see("end") # Scroll to the end
-        self.update_idletasks() # Ensure UI updates
+
+    def log_message(self, message, level="INFO"):
+        """Adds a message to the log textbox."""
+        self._append_log_lines([self._format_log_line(message, level)])
 
     def process_log_queue(self):
         """Processes messages from the log queue and updates the GUI."""
+        pending_lines = [] # Log lines drained this round, written to the textbox in one go
+        self.log_queue.clear_signal()
         try:
+            self._apply_latest_state()
             while True: # Process all messages currently in the queue
                 item = self.log_queue.get_nowait()
                 if item[0] == "LOG":
                     _, msg, level = item
-                    self.log_message(msg, level)
-                elif item[0] == "STATUS_UPDATE":
-                    _, msg = item
-                    self.status_label.configure(text=f"Status: {msg}")
-                elif item[0] == "PROGRESS_UPDATE":
-                    _, value = item # value between 0 and 1
-                    self.progress_bar.set(value)
+                    pending_lines.append(self._format_log_line(msg, level))
                 elif item[0] == "TASK_COMPLETE":
                     _, msg = item
-                    self.log_message(msg, "INFO")
+                    pending_lines.append(self._format_log_line(msg, "INFO"))
+                    self._append_log_lines(pending_lines) # Flush before the modal dialog blocks
+                    pending_lines = []
+                    self._mark_state_shown() # Earlier status/progress values must not overwrite the final state
                     self.status_label.configure(text=f"Status: {msg}")
                     self.start_button.configure(state="normal", text="Start Scraping & Editing")
                     self.is_scraping = False
@@ -123,7 +193,10 @@ class App(ctk.CTk):
                     break # Exit loop for this specific TASK_COMPLETE handling to avoid blocking
                 elif item[0] == "TASK_FAILED":
                     _, msg = item
-                    self.log_message(msg, "ERROR")
+                    pending_lines.append(self._format_log_line(msg, "ERROR"))
+                    self._append_log_lines(pending_lines)
+                    pending_lines = []
+                    self._mark_state_shown()
                     self.status_label.configure(text=f"Status: Failed - {msg}")
                     self.start_button.configure(state="normal", text="Start Scraping & Editing")
                     self.is_scraping = False
@@ -133,11 +206,30 @@ class App(ctk.CTk):
             pass # No more messages
         except Exception as e:
             # Log unexpected errors in queue processing to the textbox itself if possible
-            self.log_message(f"Error processing log queue: {e}", "CRITICAL")
+            pending_lines.append(self._format_log_line(f"Error processing log queue: {e}", "CRITICAL"))
             traceback_str = traceback.format_exc()
-            self.log_message(traceback_str, "DEBUG")
+            pending_lines.append(self._format_log_line(traceback_str, "DEBUG"))
         finally:
-            self.after(100, self.process_log_queue) # Reschedule
+            self._append_log_lines(pending_lines)
+
+    def _apply_latest_state(self):
+        """Updates the status label and progress bar from the queue's slots, only if they changed."""
+        status, progress = self.log_queue.status, self.log_queue.progress
+        if status is not None and status != self._status_shown:
+            self.status_label.configure(text=f"Status: {status}")
+            self._status_shown = status
+        if progress is not None and progress != self._progress_shown:
+            self.progress_bar.set(progress)
+            self._progress_shown = progress
+
+    def _mark_state_shown(self):
+        """Treats the current slot values as applied, e.g. once a final status has been shown."""
+        self._status_shown, self._progress_shown = self.log_queue.status, self.log_queue.progress
+
+    def _poll_log_queue(self):
+        """Drains the queue once a second, independently of the <<LogQueued>> wake-up events."""
+        self.process_log_queue()
+        self.after(1000, self._poll_log_queue)
 
     def start_scraping_thread(self):
         """Starts the scraping and editing process in a new thread."""
@@ -167,76 +259,82 @@ class App(ctk.CTk):
             messagebox.showerror("Invalid Input", "Number of videos must be an integer.")
             return
 
+        edits = dict(editor.DEFAULT_EDITS, preset=self.preset_combobox.get())
+
         self.is_scraping = True
         self.stop_event.clear()
+        # Forget the previous run's status/progress so its values are shown again if they repeat
+        self.log_queue.status = self.log_queue.progress = None
+        self._status_shown = self._progress_shown = None
         self.start_button.configure(state="disabled", text="Processing...")
         self.progress_bar.set(0)
         self.status_label.configure(text=f"Starting process for hashtag: {hashtag}...")
         self.log_message(f"Starting process for hashtag '{hashtag}' to find {num_videos} new videos...")
 
-        thread = threading.Thread(target=self.scraping_worker, args=(hashtag, num_videos,), daemon=True)
+        thread = threading.Thread(target=self.scraping_worker, args=(hashtag, num_videos, edits), daemon=True)
         thread.start()
 
-    def scraping_worker(self, hashtag, num_videos_to_find):
+    def scraping_worker(self, hashtag, num_videos_to_find, edits=None):
         """The actual work of scraping, downloading, and editing. Now uses tiktok-scraper."""
         try:
             self.log_queue.put(("LOG", "Initializing TikTok scraping process...", "INFO"))
             self.log_queue.put(("STATUS_UPDATE", f"Starting to scrape #{hashtag}..."))
             
-            # Call the new scraper function
-            # This function is expected to handle downloads and return a list of dicts:
-            # [{'id': 'video_id1', 'filepath': 'path/to/video1.mp4'}, ...]
-            downloaded_video_infos = scraper.scrape_and_download_videos_by_hashtag(
+            # The scraper yields one dict per finished download:
+            # {'id': 'video_id1', 'filepath': 'path/to/video1.mp4'}
+            # Each one is handed to an encoder thread straight away, so downloading and editing overlap.
+            downloaded_video_infos = scraper.iter_scrape_and_download_videos_by_hashtag(
                 hashtag=hashtag, 
                 num_videos_to_find=num_videos_to_find, 
                 log_queue=self.log_queue
             )
 
-            if not downloaded_video_infos:
+            edit_counts = {"edited": 0, "failed": 0}
+            total_downloaded = 0
+            pending_edits = {} # future -> video_id
+            stopped = False
+
+            with concurrent.futures.ThreadPoolExecutor(max_workers=editor.max_parallel_edits()) as executor:
+                for video_info in downloaded_video_infos:
+                    # Add this check to allow for a graceful stop
+                    if self.stop_event.is_set():
+                        stopped = True
+                        break
+
+                    total_downloaded += 1
+                    video_id = video_info.get('id')
+                    original_filepath = video_info.get('filepath')
+                    if not video_id or not original_filepath:
+                        self.log_queue.put(("LOG", f"Skipping an item due to missing ID or filepath: {video_info}", "WARNING"))
+                        edit_counts["failed"] += 1
+                        continue
+
+                    self.log_queue.put(("LOG", f"--- Queueing video {video_id} for editing ({total_downloaded}/{num_videos_to_find}) ---", "INFO"))
+                    future = executor.submit(editor.edit_video, original_filepath, video_id, edits=edits, log_queue=self.log_queue)
+                    pending_edits[future] = video_id
+
+                    # Record edits that finished while this download was in progress
+                    for done in [f for f in pending_edits if f.done()]:
+                        self._record_edit_result(done, pending_edits.pop(done), edit_counts, num_videos_to_find)
+
+                downloaded_video_infos.close() # Drops queued downloads if the loop ended early
+
+                if stopped:
+                    self.log_queue.put(("LOG", "Stop requested by user. Halting process.", "WARNING"))
+                    for future in pending_edits:
+                        future.cancel() # Edits already running are allowed to finish
+
+                for done in concurrent.futures.as_completed(pending_edits):
+                    if not done.cancelled():
+                        self._record_edit_result(done, pending_edits[done], edit_counts, num_videos_to_find)
+
+            if total_downloaded == 0:
                 self.log_queue.put(("LOG", f"No new, valid videos found or downloaded for hashtag '{hashtag}'.", "WARNING"))
                 self.log_queue.put(("TASK_COMPLETE", f"No new videos processed for #{hashtag}."))
                 return
 
-            self.log_queue.put(("LOG", f"Found {len(downloaded_video_infos)} new, valid video(s) to process.", "INFO"))
-            self.log_queue.put(("STATUS_UPDATE", "Starting video editing process..."))
-            
-            total_videos_to_process = len(downloaded_video_infos)
-            edited_count = 0
-            failed_edits = 0
-
-            for i, video_info in enumerate(downloaded_video_infos):
-                # Add this check to allow for a graceful stop
-                if self.stop_event.is_set():
-                    self.log_queue.put(("LOG", "Stop requested by user. Halting process.", "WARNING"))
-                    break
-
-                video_id = video_info.get('id')
-                original_filepath = video_info.get('filepath')
-
-                if not video_id or not original_filepath:
-                    self.log_queue.put(("LOG", f"Skipping an item due to missing ID or filepath: {video_info}", "WARNING"))
-                    failed_edits += 1
-                    continue
-
-                self.log_queue.put(("LOG", f"--- Processing video {video_id} ({i+1}/{total_videos_to_process}) ---", "INFO"))
-                self.log_queue.put(("STATUS_UPDATE", f"Editing video {video_id} ({i+1}/{total_videos_to_process})..."))
-                
-                edited_video_path = editor.edit_video(original_filepath, video_id, log_queue=self.log_queue)
-                
-                if edited_video_path:
-                    self.log_queue.put(("LOG", f"Video {video_id} edited successfully: {edited_video_path}", "SUCCESS"))
-                    utils.add_processed_video(video_id) # Add to processed list *after* successful edit
-                    edited_count += 1
-                else:
-                    self.log_queue.put(("LOG", f"Failed to edit video {video_id}. It might have been skipped or an error occurred.", "ERROR"))
-                    # We don't add to processed_videos.txt if editing failed, so it might be retried later.
-                    # The original downloaded file might still exist unless editor.py or scraper.py deleted it due to corruption.
-                    failed_edits +=1
-                
-                current_progress = (i + 1) / total_videos_to_process
-                self.log_queue.put(("PROGRESS_UPDATE", current_progress))
-
-            final_message = f"Process finished for hashtag '{hashtag}'. Successfully edited: {edited_count}/{total_videos_to_process}. Failed/Skipped: {failed_edits}."
+            edited_count, failed_edits = edit_counts["edited"], edit_counts["failed"]
+            final_message = f"Process finished for hashtag '{hashtag}'. Successfully edited: {edited_count}/{total_downloaded}. Failed/Skipped: {failed_edits}."
             if failed_edits > 0:
                 final_message += " Check logs for details on failures."
             self.log_queue.put(("TASK_COMPLETE", final_message))
@@ -250,6 +348,27 @@ class App(ctk.CTk):
             # Removed WebDriver cleanup as it's no longer used here
             self.log_queue.put(("LOG", "Scraping and editing worker thread finished.", "DEBUG"))
 
+    def _record_edit_result(self, future, video_id, edit_counts, num_videos_to_find):
+        """Logs the outcome of a finished edit and updates the progress bar."""
+        try:
+            edited_video_path = future.result()
+        except Exception as e:
+            self.log_queue.put(("LOG", f"Editing video {video_id} raised an error: {e}", "ERROR"))
+            edited_video_path = None
+
+        if edited_video_path:
+            self.log_queue.put(("LOG", f"Video {video_id} edited successfully: {edited_video_path}", "SUCCESS"))
+            utils.add_processed_video(video_id) # Add to processed list *after* successful edit
+            edit_counts["edited"] += 1
+        else:
+            self.log_queue.put(("LOG", f"Failed to edit video {video_id}. It might have been skipped or an error occurred.", "ERROR"))
+            # We don't add to processed_videos.txt if editing failed, so it might be retried later.
+            # The original downloaded file might still exist unless editor.py or scraper.py deleted it due to corruption.
+            edit_counts["failed"] += 1
+
+        finished = edit_counts["edited"] + edit_counts["failed"]
+        self.log_queue.put(("PROGRESS_UPDATE", min(finished / num_videos_to_find, 1.0)))
+
     def on_closing(self):
         """Handle window closing event."""
         if self.is_scraping:
@@ -265,9 +384,8 @@ class App(ctk.CTk):
 
 if __name__ == "__main__":
     # Ensure necessary directories exist before app starts
-    os.makedirs("videos", exist_ok=True)
-    os.makedirs("edited_videos", exist_ok=True)
-    os.makedirs("data", exist_ok=True)
+    for directory in (scraper.VIDEOS_DOWNLOAD_DIR, editor.EDITED_VIDEOS_DIR, os.path.dirname(utils.PROCESSED_VIDEOS_FILE)):
+        os.makedirs(directory, exist_ok=True)
     
     # Optional: Set the appearance mode and default color theme
     ctk.set_appearance_mode("System")  # Modes: "System" (default), "Dark", "Light"
@@ -1,16 +1,20 @@
 # This file will contain the TikTok scraping logic using Selenium.
 
 import os
-import time
+import re
+import atexit
+import threading
 import requests
-import subprocess # Added for yt-dlp
+import subprocess # Used for ffprobe
+import yt_dlp
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service as ChromeService
 from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from urllib.parse import urlparse, parse_qs
+from selenium.common.exceptions import TimeoutException
 
 import tiktok_scraper
 # If not, it might be tiktokscraper.TikTokScraper or similar
@@ -22,8 +26,13 @@ import utils
 # TIKTOK_BASE_URL = "https://www.tiktok.com/" # Kept for reference
 TRENDING_URL = "https://www.tiktok.com/foryou" # Or explore specific trending hashtags/pages
 VIDEOS_DOWNLOAD_DIR = "videos"
+MAX_PARALLEL_DOWNLOADS = 4 # Kept low to stay within TikTok's rate limits
+MIN_OK_BYTES = 50_000 # Successful downloads larger than this skip the ffprobe check
 EDITED_VIDEOS_DIR = "edited_videos" # Defined here for consistency if needed
 
+# TikTok IDs are long numbers (more than 15 digits) forming the whole path segment after /video/
+_VIDEO_ID_RE = re.compile(r'/video/(\d{16,})(?=[/?#]|$)')
+
 # Ensure download directory exists
 os.makedirs(VIDEOS_DOWNLOAD_DIR, exist_ok=True)
 os.makedirs(EDITED_VIDEOS_DIR, exist_ok=True) # Ensure editor output dir also exists
@@ -35,6 +44,9 @@ def _log(message, level="INFO", log_queue=None):
     else:
         print(f"[{level}] {message}")
 
+# chromedriver path from webdriver-manager, resolved once per process
+_DRIVER_PATH = None
+
 def setup_driver(log_queue=None):
     """Sets up and returns a Selenium Chrome WebDriver instance."""
     _log("Setting up Chrome WebDriver...", "DEBUG", log_queue)
@@ -50,9 +62,19 @@ def setup_driver(log_queue=None):
     options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/98.0.4758.102 Safari/537.36")
     # Suppress console logs from WebDriver Manager and Selenium
     options.add_experimental_option('excludeSwitches', ['enable-logging'])
-
+    # Only the video links are scraped: block images (thumbnails) via prefs and Blink settings,
+    # and keep feed previews from autoplaying without a user gesture
+    options.add_experimental_option("prefs", {
+        "profile.managed_default_content_settings.images": 2,
+    })
+    options.add_argument("--blink-settings=imagesEnabled=false")
+    options.add_argument("--autoplay-policy=user-gesture-required")
+
+    global _DRIVER_PATH
     try:
-        driver = webdriver.Chrome(service=ChromeService(ChromeDriverManager().install()), options=options)
+        if _DRIVER_PATH is None:
+            _DRIVER_PATH = ChromeDriverManager().install()
+        driver = webdriver.Chrome(service=ChromeService(_DRIVER_PATH), options=options)
         _log("WebDriver setup successful.", "DEBUG", log_queue)
         return driver
     except Exception as e:
@@ -61,20 +83,83 @@ def setup_driver(log_queue=None):
         _log("You might also need to check your internet connection for WebDriverManager.", "ERROR", log_queue)
         return None
 
+# WebDriver shared across hashtag runs; Chrome start-up and driver lookup cost seconds per run
+_driver_singleton = None
+
+def get_or_create_driver(log_queue=None):
+    """Returns the shared WebDriver, starting a new one if none exists or the previous one has died."""
+    global _driver_singleton
+    if _driver_singleton is not None:
+        try:
+            _driver_singleton.window_handles # Raises if the browser was closed or crashed
+            return _driver_singleton
+        except Exception:
+            _log("Previous WebDriver is no longer responding. Starting a new one.", "DEBUG", log_queue)
+            _driver_singleton = None
+    _driver_singleton = setup_driver(log_queue=log_queue)
+    return _driver_singleton
+
+@atexit.register
+def quit_driver():
+    """Quits the shared WebDriver, if one was started. Runs automatically at interpreter exit."""
+    global _driver_singleton
+    if _driver_singleton is not None:
+        _log("Closing WebDriver.", "DEBUG")
+        try:
+            _driver_singleton.quit()
+        except Exception as e_quit:
+            _log(f"Error while quitting WebDriver: {e_quit}", "WARNING")
+        _driver_singleton = None
+
 def get_video_id_from_url(url, log_queue=None):
     """Extracts a unique video ID from a TikTok video URL."""
     # Example URL: https://www.tiktok.com/@username/video/1234567890123456789
-    # The last part of the path is usually the video ID.
+    # The path segment after /video/ is the ID.
     try:
-        path_parts = urlparse(url).path.split('/')
-        # Find the part that is a long number (video ID)
-        for part in reversed(path_parts):
-            if part.isdigit() and len(part) > 15: # TikTok IDs are typically long numbers
-                return part
+        match = _VIDEO_ID_RE.search(url)
+        return match.group(1) if match else None
     except Exception as e:
         _log(f"Error extracting video ID from {url}: {e}", "ERROR", log_queue)
     return None
 
+# Selectors are module constants so they're built once, not per call.
+# Container of videos on a tag page. Common patterns: 'DivVideoFeed', 'DivChallengeLayoutContent', 'DivVideoList'
+_FEED_CSS = (
+    "div[class*='DivVideoFeed'], "
+    "div[class*='DivChallengeLayoutContent'], " # Often used on tag pages
+    "div[data-e2e*='challenge-video-list'], " # Another possibility for tag pages
+    "div[data-e2e*='video-feed'], "
+    "div[class*='DivItemContainer']")
+FEED_WAIT_TOTAL_SECONDS = 45 # How long to wait for the feed container to appear
+
+# Individual video links, as CSS so the browser's native selector engine is used instead of XPath
+_VIDEO_LINK_CSS = "div[data-e2e*='video-item'] a[href*='/video/'], div[class*='DivItemContainer'] a[href*='/video/']"
+
+# Installs a MutationObserver that queues the href of every link matching the CSS selector in arguments[0]
+# as it is added to the page (plus the links already there) in window.__tt_new, each href once.
+# Only the added nodes are inspected, so the page isn't re-scanned after every scroll.
+_OBSERVE_HREFS_JS = """
+const sel = arguments[0];
+const seen = new Set(), fresh = [];
+const collect = a => { if (a.href && !seen.has(a.href)) { seen.add(a.href); fresh.push(a.href); } };
+const scan = n => {
+    if (n.nodeType !== Node.ELEMENT_NODE) return;
+    if (n.matches(sel)) collect(n);
+    n.querySelectorAll(sel).forEach(collect);
+};
+if (window.__tt_observer) window.__tt_observer.disconnect();
+window.__tt_hrefs = seen;
+window.__tt_new = fresh;
+document.querySelectorAll(sel).forEach(collect);
+window.__tt_observer = new MutationObserver(records => records.forEach(
+    r => r.type === 'attributes' ? scan(r.target) : r.addedNodes.forEach(scan)));
+window.__tt_observer.observe(document.body, {subtree: true, childList: true, attributes: true, attributeFilter: ['href']});
+"""
+# Returns the hrefs queued since the last call and empties the queue
+_TAKE_NEW_HREFS_JS = "const h = window.__tt_new || []; window.__tt_new = []; return h;"
+_HAS_NEW_HREFS_JS = "return !!(window.__tt_new && window.__tt_new.length);"
+SCROLL_POLL_SECONDS = 0.2 # How often to check whether a scroll has loaded more videos
+
 def get_video_links_from_tiktok(driver, hashtag, num_videos_to_find=10, scroll_pauses=5, scroll_time=3, log_queue=None):
     """
     Navigates to TikTok, scrolls to load videos, and extracts video links and IDs.
@@ -94,6 +179,7 @@ def get_video_links_from_tiktok(driver, hashtag, num_videos_to_find=10, scroll_p
     if log_queue: log_queue.put(("STATUS_UPDATE", f"Navigating to tag: {hashtag}..."))
     
     try:
+        driver.delete_all_cookies() # The driver is reused between hashtags; start each one from a clean session
         driver.get(target_url)
     except Exception as e:
         _log(f"Error navigating to {target_url}: {e}", "ERROR", log_queue)
@@ -102,19 +188,10 @@ def get_video_links_from_tiktok(driver, hashtag, num_videos_to_find=10, scroll_p
     _log(f"Please wait for page to load. Manually handle CAPTCHAs/pop-ups if they appear.", "INFO", log_queue)
     if log_queue: log_queue.put(("STATUS_UPDATE", "Waiting for TikTok page to load (handle popups/CAPTCHA if any)..."))
 
-    # XPath for the container of videos. This might need adjustment for tag pages.
-    # Common patterns: 'DivVideoFeed', 'DivChallengeLayoutContent', 'DivVideoList'
-    feed_container_xpath = (
-        "//div[contains(@class, 'DivVideoFeed')] | "
-        "//div[contains(@class, 'DivChallengeLayoutContent')] | " # Often used on tag pages
-        "//div[contains(@data-e2e, 'challenge-video-list')] | " # Another possibility for tag pages
-        "//div[contains(@data-e2e, 'video-feed')] | "
-        "//div[contains(@class, 'DivItemContainer')] | "
-        "//div[starts-with(@class, 'DivVideoFeed')]")
-
     try:
-        WebDriverWait(driver, 45).until(
-            EC.presence_of_element_located((By.XPATH, feed_container_xpath))
+        # Left at the full budget: the user may need this time to solve a CAPTCHA or close a pop-up
+        WebDriverWait(driver, FEED_WAIT_TOTAL_SECONDS).until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, _FEED_CSS))
         )
         _log("Main video feed/list container detected on tag page.", "INFO", log_queue)
     except Exception as e:
@@ -126,9 +203,11 @@ def get_video_links_from_tiktok(driver, hashtag, num_videos_to_find=10, scroll_p
 
     video_info_list = []
     found_video_ids = set()
-
-    # XPath for individual video items/links. This is relatively generic.
-    video_elements_xpath = "//div[contains(@data-e2e, 'video-item') or contains(@class, 'DivItemContainer') or (starts-with(@class, 'tiktok-') and contains(@class, 'DivItemContainer'))]//a[contains(@href,'/video/')]"
+    try:
+        driver.execute_script(_OBSERVE_HREFS_JS, _VIDEO_LINK_CSS)
+    except Exception as e_observe:
+        _log(f"Error installing the video link observer on tag page '{hashtag}': {e_observe}", "ERROR", log_queue)
+        return []
 
     for i in range(scroll_pauses):
         _log(f"Scroll attempt {i+1}/{scroll_pauses} for hashtag '{hashtag}'. Scrolling down...", "DEBUG", log_queue)
@@ -136,37 +215,48 @@ def get_video_links_from_tiktok(driver, hashtag, num_videos_to_find=10, scroll_p
         
         try:
             driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            _log(f"Waiting {scroll_time} seconds for videos to load...", "DEBUG", log_queue)
-            time.sleep(scroll_time)
+            _log(f"Waiting up to {scroll_time} seconds for videos to load...", "DEBUG", log_queue)
+            # Stop waiting as soon as new video links appear instead of always sleeping scroll_time
+            WebDriverWait(driver, scroll_time, poll_frequency=SCROLL_POLL_SECONDS).until(
+                lambda d: d.execute_script(_HAS_NEW_HREFS_JS)
+            )
+        except TimeoutException:
+            _log(f"No new video links appeared within {scroll_time} seconds.", "DEBUG", log_queue)
         except Exception as e_scroll:
             _log(f"Error during scrolling or sleep: {e_scroll}", "WARNING", log_queue)
             # Decide if we should break or continue if scrolling fails
             break
 
         try:
-            video_elements = driver.find_elements(By.XPATH, video_elements_xpath)
+            video_hrefs = driver.execute_script(_TAKE_NEW_HREFS_JS) or []
         except Exception as e_find:
-            _log(f"Error finding video elements with XPath: {e_find}", "ERROR", log_queue)
-            video_elements = [] # Avoid crashing, proceed as if none found
+            _log(f"Error reading collected video links: {e_find}", "ERROR", log_queue)
+            video_hrefs = [] # Avoid crashing, proceed as if none found
             
-        _log(f"Found {len(video_elements)} potential video link elements after scroll {i+1}.", "DEBUG", log_queue)
-
-        for element in video_elements:
-            try:
-                video_url = element.get_attribute('href')
-                if video_url and '/video/' in video_url:
-                    video_id = get_video_id_from_url(video_url, log_queue)
-                    if video_id and video_id not in found_video_ids:
-                        if not utils.is_video_processed(video_id):
-                            _log(f"Found new video: ID - {video_id}, URL - {video_url}", "INFO", log_queue)
-                            video_info_list.append((video_id, video_url))
-                            found_video_ids.add(video_id)
-                            if len(video_info_list) >= num_videos_to_find:
-                                break
-                        else:
-                            _log(f"Skipping already processed video ID (from file): {video_id}", "DEBUG", log_queue)
-            except Exception as e:
-                _log(f"Error processing a video element: {e}", "ERROR", log_queue)
+        _log(f"Found {len(video_hrefs)} new potential video links after scroll {i+1}.", "DEBUG", log_queue)
+
+        # Collect this scroll's candidates first, then drop known IDs with set operations
+        candidates = {} # video_id -> video_url, in page order
+        for video_url in video_hrefs:
+            if video_url and '/video/' in video_url:
+                video_id = get_video_id_from_url(video_url, log_queue)
+                if video_id:
+                    candidates.setdefault(video_id, video_url)
+
+        processed_ids = utils.get_processed_videos()
+        fresh_ids = candidates.keys() - found_video_ids - processed_ids
+        skipped_processed = len(candidates.keys() & processed_ids)
+        if skipped_processed:
+            _log(f"Skipping {skipped_processed} already processed video ID(s) (from file).", "DEBUG", log_queue)
+
+        for video_id, video_url in candidates.items():
+            if video_id not in fresh_ids:
+                continue
+            _log(f"Found new video: ID - {video_id}, URL - {video_url}", "INFO", log_queue)
+            video_info_list.append((video_id, video_url))
+            found_video_ids.add(video_id)
+            if len(video_info_list) >= num_videos_to_find:
+                break
         
         if len(video_info_list) >= num_videos_to_find:
             _log(f"Target number of {num_videos_to_find} new videos found for hashtag '{hashtag}'.", "INFO", log_queue)
@@ -182,6 +272,55 @@ def get_video_links_from_tiktok(driver, hashtag, num_videos_to_find=10, scroll_p
 
     return video_info_list[:num_videos_to_find]
 
+def _file_size(filepath):
+    """Returns the size of filepath in bytes with a single stat call, or None if it doesn't exist."""
+    try:
+        return os.stat(filepath).st_size
+    except OSError:
+        return None
+
+# YoutubeDL instances are not safe to share between threads, so each download thread keeps its own
+# and reuses it (session cookies, open HTTP connections) for every video it fetches
+_ydl_local = threading.local()
+# Every instance handed out by _get_ydl, so they can be closed once their threads are done
+_ydl_instances = []
+_ydl_instances_lock = threading.Lock()
+
+def _get_ydl(download_folder):
+    """Returns the calling thread's YoutubeDL for download_folder, creating it on first use."""
+    instances = getattr(_ydl_local, "instances", None)
+    if instances is None:
+        instances = _ydl_local.instances = {}
+    ydl = instances.get(download_folder)
+    if ydl is None:
+        ydl = yt_dlp.YoutubeDL({
+            'outtmpl': os.path.join(download_folder, '%(id)s.mp4'),
+            'quiet': True,
+            'no_warnings': True,
+            'retries': 3,
+            'fragment_retries': 3,
+            'concurrent_fragment_downloads': 4, # Fetch HLS/DASH fragments in parallel
+            'noplaylist': True,
+            'socket_timeout': 30,
+        })
+        instances[download_folder] = ydl
+        with _ydl_instances_lock:
+            _ydl_instances.append(ydl)
+    return ydl
+
+@atexit.register
+def _close_ydl_instances():
+    """Closes every YoutubeDL created by _get_ydl (cookie jar, HTTP sessions). Call only when no download is running."""
+    with _ydl_instances_lock:
+        instances = _ydl_instances[:]
+        _ydl_instances.clear()
+    for ydl in instances:
+        try:
+            ydl.close()
+        except Exception:
+            pass
+    _ydl_local.instances = {} # Only resets the calling thread's cache; pool threads have exited by now
+
 def download_video(video_id, video_url, download_folder=VIDEOS_DOWNLOAD_DIR, log_queue=None):
     """Downloads a video from the given URL using yt-dlp if it hasn't been processed.
        Returns the path to the downloaded video, or None otherwise.
@@ -191,192 +330,154 @@ def download_video(video_id, video_url, download_folder=VIDEOS_DOWNLOAD_DIR, log
         return None
 
     filepath = os.path.join(download_folder, f"{video_id}.mp4")
-    os.makedirs(download_folder, exist_ok=True)
-    process = None # Initialize process to None
 
     try:
         _log(f"Attempting to download video: {video_id} from {video_url} using yt-dlp...", "INFO", log_queue)
         if log_queue: log_queue.put(("STATUS_UPDATE", f"Downloading video {video_id}..."))
 
-        command = [
-            "yt-dlp", "--no-warnings", "--ignore-errors", "--retries", "3",
-            "--fragment-retries", "3", "--no-playlist", "-o", filepath,
-            video_url,
-            "--socket-timeout", "30"
-        ]
-        
-        creation_flags = subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
-        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, creationflags=creation_flags)
-        stdout, stderr = process.communicate(timeout=120)
-
-        if process.returncode == 0 and os.path.exists(filepath) and os.path.getsize(filepath) > 0:
-            _log(f"Video {video_id} downloaded by yt-dlp. Verifying integrity with ffprobe...", "DEBUG", log_queue)
-            
-            # --- Add ffprobe verification step ---
-            ffprobe_command = ["ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries", "stream=codec_name", "-of", "default=noprint_wrappers=1:nokey=1", filepath]
-            try:
-                verify_process = subprocess.Popen(ffprobe_command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, creationflags=creation_flags)
-                ff_stdout, ff_stderr = verify_process.communicate(timeout=30)
-
-                if verify_process.returncode == 0 and ff_stdout.strip(): # Check for codec name output
-                    _log(f"Video {video_id} integrity verified by ffprobe. Codec: {ff_stdout.strip()}", "SUCCESS", log_queue)
-                    return filepath
-                else:
-                    _log(f"ffprobe verification failed for {filepath}. Video might be corrupt.", "ERROR", log_queue)
-                    _log(f"ffprobe RC: {verify_process.returncode}", "ERROR", log_queue)
-                    _log(f"ffprobe stdout: {ff_stdout.strip()}", "DEBUG", log_queue)
-                    _log(f"ffprobe stderr: {ff_stderr.strip()}", "ERROR", log_queue)
-                    if os.path.exists(filepath):
-                        try: os.remove(filepath)
-                        except OSError as e_rem: _log(f"Error removing corrupted download file {filepath}: {e_rem}", "ERROR", log_queue)
-                    return None
-            except subprocess.TimeoutExpired:
-                _log(f"ffprobe timed out verifying {filepath}. Assuming corrupt.", "ERROR", log_queue)
-                if verify_process and verify_process.poll() is None: verify_process.kill()
-                if os.path.exists(filepath):
-                    try: os.remove(filepath)
-                    except OSError as e_rem: _log(f"Error removing timed-out verification file {filepath}: {e_rem}", "ERROR", log_queue)
-                return None
-            except FileNotFoundError: # ffprobe not found
-                _log("CRITICAL: ffprobe (part of FFmpeg) not found in PATH. Cannot verify video integrity.", "CRITICAL", log_queue)
-                _log("Please ensure FFmpeg is installed and in PATH. The downloaded file will be kept but may be corrupt.", "WARNING", log_queue)
-                return filepath # Return path, but it's unverified
-            except Exception as e_ffprobe:
-                _log(f"Error during ffprobe verification for {filepath}: {e_ffprobe}", "ERROR", log_queue)
-                if os.path.exists(filepath):
-                    try: os.remove(filepath)
-                    except OSError as e_rem: _log(f"Error removing file after ffprobe error {filepath}: {e_rem}", "ERROR", log_queue)
-                return None
-            # --- End ffprobe verification step ---
-
+        # yt-dlp runs in-process: no interpreter start-up per video, and its info dict reports the codec,
+        # so a separate ffprobe run is only needed when it doesn't
+        ydl = _get_ydl(download_folder)
+        info = ydl.extract_info(video_url, download=True)
+        if info:
+            filepath = ydl.prepare_filename(info) # Normally {download_folder}/{video_id}.mp4
+
+        file_size = _file_size(filepath)
+        if info and file_size:
+            codec = info.get('vcodec')
+            if codec and codec != 'none':
+                _log(f"Video {video_id} downloaded and verified by yt-dlp. Codec: {codec}", "SUCCESS", log_queue)
+                return filepath
+            _log(f"Video {video_id} downloaded by yt-dlp without codec info. Verifying integrity with ffprobe...", "DEBUG", log_queue)
+            return filepath if verify_downloaded_video(filepath, video_id, log_queue, download_ok=True, file_size=file_size) else None
         else:
-            _log(f"Failed to download video {video_id}. yt-dlp RC: {process.returncode}", "ERROR", log_queue)
-            _log(f"File path: {filepath}, Exists: {os.path.exists(filepath)}, Size: {os.path.getsize(filepath) if os.path.exists(filepath) else 'N/A'}", "DEBUG", log_queue)
-            _log(f"yt-dlp stdout: {stdout.strip()}", "DEBUG", log_queue)
-            _log(f"yt-dlp stderr: {stderr.strip()}", "ERROR", log_queue)
-            if os.path.exists(filepath) and (os.path.getsize(filepath) == 0 or process.returncode != 0):
+            _log(f"Failed to download video {video_id}. yt-dlp returned {'no info' if not info else 'an empty file'}.", "ERROR", log_queue)
+            _log(f"File path: {filepath}, Exists: {file_size is not None}, Size: {file_size if file_size is not None else 'N/A'}", "DEBUG", log_queue)
+            if file_size is not None:
                 try: os.remove(filepath)
                 except OSError as e_rem: _log(f"Error removing problematic download file {filepath}: {e_rem}", "ERROR", log_queue)
             return None
 
-    except subprocess.TimeoutExpired:
-        _log(f"yt-dlp timed out downloading video {video_id}.", "ERROR", log_queue)
-        if process and process.poll() is None: process.kill()
-        # It's tricky to get stdout/stderr reliably after process.kill() before communicate was called
-        # So we ensure communication happened before or this will hang
-        # stdout, stderr = process.communicate() # This would hang if not already communicated
-        _log(f"yt-dlp process killed due to timeout.", "DEBUG", log_queue) # Simplified logging here
-        if os.path.exists(filepath):
-            try: os.remove(filepath)
-            except OSError as e_rem_tout: _log(f"Error removing timed-out download file {filepath}: {e_rem_tout}", "ERROR", log_queue)
-        return None
-    except FileNotFoundError: # yt-dlp not found
-        _log("CRITICAL: yt-dlp command not found. Ensure yt-dlp is installed and in PATH.", "CRITICAL", log_queue)
-        _log("Install with: pip install yt-dlp", "CRITICAL", log_queue)
+    except yt_dlp.utils.DownloadError as e:
+        # Carries yt-dlp's own error text, which is otherwise only written to the process stderr
+        _log(f"yt-dlp failed to download video {video_id}: {e}", "ERROR", log_queue)
+        try: os.remove(filepath)
+        except FileNotFoundError: pass
+        except OSError as e_rem_ex: _log(f"Error removing file {filepath} on exception: {e_rem_ex}", "ERROR", log_queue)
         return None
     except Exception as e:
         _log(f"An unexpected error occurred downloading video {video_id}: {e}", "ERROR", log_queue)
-        # Ensure process is not None before checking returncode
-        rc = process.returncode if process else 'N/A'
-        if os.path.exists(filepath):
-             if not (os.path.getsize(filepath) > 0 and rc == 0) :
-                try: os.remove(filepath)
-                except OSError as e_rem_ex: _log(f"Error removing file {filepath} on exception: {e_rem_ex}", "ERROR", log_queue)
+        try: os.remove(filepath)
+        except FileNotFoundError: pass
+        except OSError as e_rem_ex: _log(f"Error removing file {filepath} on exception: {e_rem_ex}", "ERROR", log_queue)
         return None
 
+# Key paths to try, in order, when looking for the video ID in tiktok-scraper metadata
+_ID_LOOKUPS = (
+    ('id',),
+    ('itemId',),
+    ('video_id',),
+    ('itemInfos', 'id'), # Used by some structures
+    ('video', 'id'), # Fallback for other potential structures
+)
+
 def get_video_id_from_metadata(video_data):
     """
     Extracts a unique video ID from tiktok-scraper metadata.
     """
     if not video_data:
         return None
-    
-    possible_id_keys = ['id', 'itemId', 'video_id', 'itemInfos.id'] # itemInfos.id for some structures
-    for key in possible_id_keys:
-        if '.' in key: # Handle nested keys like 'itemInfos.id'
-            parts = key.split('.')
-            value = video_data
-            try:
-                for part in parts:
-                    value = value[part]
-                if value: return str(value)
-            except (KeyError, TypeError):
-                continue
-        elif isinstance(video_data, dict) and video_data.get(key):
-            return str(video_data[key])
-    
-    # Fallback for other potential structures if necessary
-    if isinstance(video_data, dict) and video_data.get('video', {}).get('id'):
-         return str(video_data['video']['id'])
+
+    for path in _ID_LOOKUPS:
+        value = video_data
+        for key in path:
+            value = value.get(key) if isinstance(value, dict) else None
+            if value is None:
+                break
+        if value:
+            return str(value)
 
     _log(f"Could not extract video ID from metadata structure: {str(video_data)[:200]}...", "WARNING")
     return None
 
-def verify_downloaded_video(filepath, video_id, log_queue=None):
+def _run_ffprobe(filepath, log_queue=None):
     """
-    Verifies the integrity of a downloaded video using ffprobe.
-    Returns True if valid, False otherwise. Deletes invalid file.
+    Reads the codec of the first video stream of filepath with ffprobe.
+    Returns (ok, codec): (True, codec) if the stream was readable, (False, None) if ffprobe failed or timed out.
+    If ffprobe isn't installed the file can't be checked, so (True, None) is returned and a warning is logged.
     """
-    if not os.path.exists(filepath) or os.path.getsize(filepath) == 0:
-        _log(f"File {filepath} for video {video_id} is missing or empty before ffprobe check.", "ERROR", log_queue)
-        if os.path.exists(filepath): # Remove if zero size
-            try: os.remove(filepath)
-            except OSError: pass
-        return False
-
-    _log(f"Verifying integrity of {filepath} for video {video_id} with ffprobe...", "DEBUG", log_queue)
+    # Only the stream header is needed to read the codec, so cap how much ffprobe reads and analyzes
     ffprobe_command = [
-        "ffprobe", "-v", "error", "-select_streams", "v:0", 
+        "ffprobe", "-v", "error", "-probesize", "32768", "-analyzeduration", "0", "-select_streams", "v:0", 
         "-show_entries", "stream=codec_name", "-of", "default=noprint_wrappers=1:nokey=1", filepath
     ]
     creation_flags = subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
-    verify_process = None
     try:
-        verify_process = subprocess.Popen(ffprobe_command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, creationflags=creation_flags)
-        ff_stdout, ff_stderr = verify_process.communicate(timeout=30)
-
-        if verify_process.returncode == 0 and ff_stdout.strip():
-            _log(f"Video {video_id} integrity verified by ffprobe. Codec: {ff_stdout.strip()}", "SUCCESS", log_queue)
-            return True
-        else:
-            _log(f"ffprobe verification failed for {filepath} (ID: {video_id}). Video might be corrupt.", "ERROR", log_queue)
-            _log(f"ffprobe RC: {verify_process.returncode}, STDOUT: '{ff_stdout.strip()}', STDERR: '{ff_stderr.strip()}'", "DEBUG", log_queue)
-            if os.path.exists(filepath):
-                try: os.remove(filepath)
-                except OSError as e_rem: _log(f"Error removing corrupted download file {filepath}: {e_rem}", "ERROR", log_queue)
-            return False
+        result = subprocess.run(ffprobe_command, capture_output=True, text=True, timeout=30, creationflags=creation_flags)
+
+        codec = result.stdout.strip()
+        if result.returncode == 0 and codec:
+            return True, codec
+        _log(f"ffprobe could not read a video stream from {filepath}.", "ERROR", log_queue)
+        _log(f"ffprobe RC: {result.returncode}, STDOUT: '{codec}', STDERR: '{result.stderr.strip()}'", "DEBUG", log_queue)
+        return False, None
     except subprocess.TimeoutExpired:
-        _log(f"ffprobe timed out verifying {filepath} (ID: {video_id}). Assuming corrupt.", "ERROR", log_queue)
-        if verify_process and verify_process.poll() is None: verify_process.kill()
-        if os.path.exists(filepath): 
-            try: os.remove(filepath)
-            except OSError as e_rem: _log(f"Error removing file after ffprobe timeout {filepath}: {e_rem}", "ERROR", log_queue)
-        return False
+        _log(f"ffprobe timed out reading {filepath}.", "ERROR", log_queue) # subprocess.run has already killed it
+        return False, None
     except FileNotFoundError:
         _log("CRITICAL: ffprobe (part of FFmpeg) not found in PATH. Cannot verify video integrity.", "CRITICAL", log_queue)
         _log("Please ensure FFmpeg is installed and in PATH. Downloaded files will be kept but may be corrupt.", "WARNING", log_queue)
-        return True # Keep file but warn, editing might fail
+        return True, None # Keep file but warn, editing might fail
     except Exception as e_ffprobe:
-        _log(f"Error during ffprobe verification for {filepath} (ID: {video_id}): {e_ffprobe}", "ERROR", log_queue)
-        if os.path.exists(filepath): 
+        _log(f"Error running ffprobe on {filepath}: {e_ffprobe}", "ERROR", log_queue)
+        return False, None
+
+def verify_downloaded_video(filepath, video_id, log_queue=None, download_ok=False, file_size=None):
+    """
+    Verifies the integrity of a downloaded video using ffprobe.
+    If download_ok is True (the downloader reported success), files larger than MIN_OK_BYTES are accepted without probing.
+    file_size may be passed by callers that have already stat'ed the file.
+    Returns True if valid, False otherwise. Deletes invalid file.
+    """
+    if file_size is None:
+        file_size = _file_size(filepath)
+    if not file_size:
+        _log(f"File {filepath} for video {video_id} is missing or empty before ffprobe check.", "ERROR", log_queue)
+        if file_size is not None: # Remove if zero size
             try: os.remove(filepath)
-            except OSError as e_rem: _log(f"Error removing file after ffprobe error {filepath}: {e_rem}", "ERROR", log_queue)
+            except OSError: pass
         return False
 
-def scrape_and_download_videos_by_hashtag(hashtag: str, num_videos_to_find: int, log_queue=None):
+    if download_ok and file_size > MIN_OK_BYTES:
+        _log(f"Video {video_id} downloaded successfully and is {file_size} bytes. Skipping ffprobe check.", "DEBUG", log_queue)
+        return True
+
+    _log(f"Verifying integrity of {filepath} for video {video_id} with ffprobe...", "DEBUG", log_queue)
+    ok, codec = _run_ffprobe(filepath, log_queue)
+    if ok:
+        if codec:
+            _log(f"Video {video_id} integrity verified by ffprobe. Codec: {codec}", "SUCCESS", log_queue)
+        return True
+
+    _log(f"Video {video_id} failed verification and is assumed corrupt. Removing {filepath}.", "ERROR", log_queue)
+    try: os.remove(filepath) # The file was stat'ed above, so no exists() check
+    except FileNotFoundError: pass
+    except OSError as e_rem: _log(f"Error removing corrupted download file {filepath}: {e_rem}", "ERROR", log_queue)
+    return False
+
+def iter_scrape_and_download_videos_by_hashtag(hashtag: str, num_videos_to_find: int, log_queue=None):
     """
     Orchestrates scraping video links with Selenium and downloading with yt-dlp.
-    Returns a list of dictionaries with info about downloaded videos.
+    Yields a dictionary with info about each video as soon as its download finishes,
+    so callers can start editing while the remaining videos are still downloading.
     """
     _log(f"Initializing scraping process for hashtag: #{hashtag}", "INFO", log_queue)
-    processed_video_details = []
-    driver = None  # Initialize driver to None
 
     try:
-        driver = setup_driver(log_queue=log_queue)
+        driver = get_or_create_driver(log_queue=log_queue)
         if not driver:
             _log("Failed to setup WebDriver. Aborting scrape.", "CRITICAL", log_queue)
-            return []
+            return
 
         # Step 1: Get video links using Selenium
         video_links_info = get_video_links_from_tiktok(
@@ -388,42 +489,47 @@ def scrape_and_download_videos_by_hashtag(hashtag: str, num_videos_to_find: int,
 
         if not video_links_info:
             _log(f"No new video links found for hashtag '{hashtag}'.", "WARNING", log_queue)
-            return []
+            return
         
         total_to_download = len(video_links_info)
         _log(f"Found {total_to_download} new video(s). Starting download process...", "INFO", log_queue)
 
-        # Step 2: Download each video using yt-dlp
-        for i, (video_id, video_url) in enumerate(video_links_info):
-            if log_queue:
-                log_queue.put(("STATUS_UPDATE", f"Downloading video {i+1}/{total_to_download}..."))
-            
-            downloaded_filepath = download_video(
-                video_id=video_id,
-                video_url=video_url,
-                log_queue=log_queue
-            )
-
-            if downloaded_filepath:
-                _log(f"Successfully downloaded video {video_id} to {downloaded_filepath}", "SUCCESS", log_queue)
-                processed_video_details.append({'id': video_id, 'filepath': downloaded_filepath})
-            else:
-                _log(f"Failed to download video {video_id}. It may have been skipped or an error occurred.", "ERROR", log_queue)
-        
-        return processed_video_details
+        # Step 2: Download the videos with yt-dlp, several at a time (downloads are network-bound)
+        executor = ThreadPoolExecutor(max_workers=MAX_PARALLEL_DOWNLOADS)
+        try:
+            futures = {
+                executor.submit(download_video, video_id=video_id, video_url=video_url, log_queue=log_queue): video_id
+                for video_id, video_url in video_links_info
+            }
+            for finished, future in enumerate(as_completed(futures), start=1):
+                video_id = futures[future]
+                if log_queue:
+                    log_queue.put(("STATUS_UPDATE", f"Downloaded {finished}/{total_to_download} video(s)..."))
+
+                downloaded_filepath = future.result()
+                if downloaded_filepath:
+                    _log(f"Successfully downloaded video {video_id} to {downloaded_filepath}", "SUCCESS", log_queue)
+                    yield {'id': video_id, 'filepath': downloaded_filepath}
+                else:
+                    _log(f"Failed to download video {video_id}. It may have been skipped or an error occurred.", "ERROR", log_queue)
+        finally:
+            # If the caller stops early, queued downloads are dropped and running ones finish
+            executor.shutdown(wait=True, cancel_futures=True)
+            # The pool's threads are gone, so their YoutubeDL instances can't be reused
+            _close_ydl_instances()
 
     except Exception as e:
         _log(f"An unexpected error occurred during the main scraping/downloading process: {e}", "CRITICAL", log_queue)
         import traceback
         _log(traceback.format_exc(), "DEBUG", log_queue)
-        return processed_video_details # Return any videos that were processed before the error
-    finally:
-        if driver:
-            _log("Closing WebDriver.", "DEBUG", log_queue)
-            try:
-                driver.quit()
-            except Exception as e_quit:
-                _log(f"Error while quitting WebDriver: {e_quit}", "WARNING", log_queue)
+        # Videos yielded before the error have already been handed to the caller
+
+def scrape_and_download_videos_by_hashtag(hashtag: str, num_videos_to_find: int, log_queue=None):
+    """
+    Orchestrates scraping video links with Selenium and downloading with yt-dlp.
+    Returns a list of dictionaries with info about downloaded videos.
+    """
+    return list(iter_scrape_and_download_videos_by_hashtag(hashtag, num_videos_to_find, log_queue=log_queue))
 
 if __name__ == '__main__':
     print("Starting TikTok Scraper Test (using tiktok-scraper library)...")
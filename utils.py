@@ -1,7 +1,9 @@
 # This file will contain utility functions, e.g., for managing processed video IDs. 
 
 import os
+import atexit
 import datetime
+import threading
 
 PROCESSED_VIDEOS_FILE = os.path.join("data", "processed_videos.txt")
 
@@ -9,42 +11,81 @@ def get_timestamp():
     """Returns the current time as a formatted string."""
     return datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-def get_processed_videos(filepath=PROCESSED_VIDEOS_FILE):
+# In-memory copy of each processed-videos file, keyed by path, so lookups don't re-read the file
+_processed_cache = {}
+_cache_lock = threading.Lock()
+# Append-mode handles for the processed-videos files, keyed by path and kept open between writes
+_processed_files = {}
+
+def _cached_processed_videos(filepath):
     """
-    Loads the set of processed video IDs from the specified file.
-    Returns an empty set if the file doesn't exist.
+    Returns the cached set of processed video IDs for filepath, reading the file on first use.
+    Must be called with _cache_lock held.
     """
+    processed_videos = _processed_cache.get(filepath)
+    if processed_videos is not None:
+        return processed_videos
+
     if not os.path.exists(filepath):
         # Create the data directory if it doesn't exist
         os.makedirs(os.path.dirname(filepath), exist_ok=True)
-        return set()
-    try:
-        with open(filepath, "r", encoding="utf-8") as f:
-            return set(line.strip() for line in f if line.strip())
-    except Exception as e:
-        print(f"Error loading processed videos: {e}")
-        return set()
+        processed_videos = set()
+    else:
+        try:
+            with open(filepath, "r", encoding="utf-8") as f:
+                processed_videos = set(line.strip() for line in f if line.strip())
+        except Exception as e:
+            print(f"Error loading processed videos: {e}")
+            return set() # Not cached, so the next call tries the file again
+    _processed_cache[filepath] = processed_videos
+    return processed_videos
+
+def get_processed_videos(filepath=PROCESSED_VIDEOS_FILE):
+    """
+    Loads the set of processed video IDs from the specified file.
+    The file is read once and then served from memory; a copy is returned.
+    Returns an empty set if the file doesn't exist.
+    """
+    with _cache_lock:
+        return set(_cached_processed_videos(filepath))
 
 def add_processed_video(video_id, filepath=PROCESSED_VIDEOS_FILE):
     """
     Adds a video ID to the processed videos file.
     """
     try:
-        # Ensure the directory exists
-        os.makedirs(os.path.dirname(filepath), exist_ok=True)
-        with open(filepath, "a", encoding="utf-8") as f:
+        with _cache_lock:
+            processed_videos = _cached_processed_videos(filepath)
+            f = _processed_files.get(filepath)
+            if f is None:
+                # Ensure the directory exists
+                os.makedirs(os.path.dirname(filepath), exist_ok=True)
+                f = _processed_files[filepath] = open(filepath, "a", encoding="utf-8")
             f.write(f"{video_id}\n")
+            f.flush() # Keep the file current in case the app is killed
+            processed_videos.add(video_id)
         return True
     except Exception as e:
         print(f"Error adding processed video: {e}")
         return False
 
+@atexit.register
+def close_processed_files():
+    """Closes the open processed-videos file handles."""
+    with _cache_lock:
+        for f in _processed_files.values():
+            try:
+                f.close()
+            except Exception as e:
+                print(f"Error closing processed videos file: {e}")
+        _processed_files.clear()
+
 def is_video_processed(video_id, filepath=PROCESSED_VIDEOS_FILE):
     """
     Checks if a video ID has already been processed.
     """
-    processed_videos = get_processed_videos(filepath)
-    return video_id in processed_videos
+    with _cache_lock:
+        return video_id in _cached_processed_videos(filepath)
 
 if __name__ == '__main__':
     # Test functions
@@ -66,6 +107,7 @@ if __name__ == '__main__':
     print(f"Is 'video3' processed? {is_video_processed('video3', test_file)}")
 
     # Clean up test file
+    close_processed_files()
     if os.path.exists(test_file):
         os.remove(test_file)
     print("Test complete.") 
\ No newline at end of file